@@ -0,0 +1,26 @@
+"""
+ctgov_http.py ― clinicaltrials.gov API を叩くスクリプト（get_trial_drugs.py / get_trial_drugs_with_nctid.py）で
+共有する HTTP 設定
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 一時的なエラーとして再試行するステータスと、再試行の回数・指数バックオフの係数
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_TOTAL = 3
+BACKOFF_FACTOR = 0.5
+
+
+def make_session() -> requests.Session:
+    """
+    keep-alive で TCP/TLS 接続を使い回すための共有セッション。
+    一時的なエラー（429 / 5xx）は指数バックオフで再試行する。
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=RETRY_TOTAL, backoff_factor=BACKOFF_FACTOR, status_forcelist=RETRY_STATUSES, allowed_methods=("GET",)
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retry))
+    return session
@@ -1,41 +1,51 @@
-import requests
+import orjson
 from typing import List, Tuple, Optional
 
+from ctgov_http import make_session
+
 BASE = "https://clinicaltrials.gov/api/v2"
 
+_SESSION = make_session()
+
 
 def _search_nct_id_and_drugs(trial_name: str) -> Tuple[Optional[str], List[str]]:
     """
-    試験名（例: "CheckMate 227"）を検索し、すべてのヒットに登録されている Drug 介入名を重複なく配列で返す
+    試験名（例: "CheckMate 227"）を検索し、最上位ヒットの NCT ID と、
+    すべてのヒットに登録されている Drug 介入名（重複なし）を `(NCT ID, [drug, ...])` で返す
     """
     params = {
         "query.titles": trial_name,  # タイトル全文検索
-        "fields": "NCTId,BriefTitle,protocolSection.armsInterventionsModule.interventions",
+        # 参照するのは NCT ID と介入情報のみ
+        "fields": "protocolSection.identificationModule.nctId,protocolSection.armsInterventionsModule.interventions",
         "pageSize": 5,
         "format": "json",
     }
 
-    resp = requests.get(f"{BASE}/studies", params=params, timeout=30)
+    resp = _SESSION.get(f"{BASE}/studies", params=params, timeout=30)
     resp.raise_for_status()
-    data = resp.json()
+    data = orjson.loads(resp.content)
 
     studies = data.get("studies", [])
     if not studies:
         return None, []
 
-    # すべてのヒットから Drug 介入を収集
-    drugs: List[str] = []
-    for st in studies:
-        interventions = st["protocolSection"].get("armsInterventionsModule", {}).get("interventions", [])
-        drugs.extend(iv["name"] for iv in interventions if iv.get("type") == "DRUG")
+    nct_id = studies[0]["protocolSection"]["identificationModule"]["nctId"]
 
-    # --- 重複削除（順序保持）---
-    drugs = list(dict.fromkeys(drugs))
+    # すべてのヒットから Drug 介入を収集し、重複削除（順序保持）
+    drugs = list(
+        dict.fromkeys(
+            iv["name"]
+            for st in studies
+            for iv in st["protocolSection"].get("armsInterventionsModule", {}).get("interventions", [])
+            if iv.get("type") == "DRUG"
+        )
+    )
 
-    return drugs
+    return nct_id, drugs
 
 
 if __name__ == "__main__":
     trial = "CheckMate227"
-    drugs = _search_nct_id_and_drugs(trial)
+    nct, drugs = _search_nct_id_and_drugs(trial)
+    print(f"{trial} → NCT ID: {nct}")
     print("使用薬剤:", ", ".join(drugs))
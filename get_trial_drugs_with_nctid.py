@@ -1,25 +1,46 @@
-import requests
-from typing import List, Tuple, Optional
+import asyncio
+
+import httpx
+import orjson
+from cachetools import TTLCache
+from cachetools.keys import hashkey
+from typing import List, Tuple, Optional, Union
+
+from ctgov_http import BACKOFF_FACTOR, RETRY_STATUSES, RETRY_TOTAL, make_session
 
 BASE = "https://clinicaltrials.gov/api/v2"
 
+# 一括取得時の同時リクエスト数の上限
+MAX_CONCURRENCY = 10
 
-def _search_nct_id(trial_name: str) -> Optional[str]:
-    """
-    試験の略称・正式名称（例: "CheckMate 227"）を投げて
-    最も関連性が高い候補の NCT ID を返す
-    """
-    params = {
+# clinicaltrials.gov の登録内容は日単位でしか変わらないため、1 時間はキャッシュを返す。
+# 見つからなかった結果（None / 薬剤なし）は後から登録されることがあるのでキャッシュしない。
+# 薬剤リストは呼び出し側に書き換えられないようタプルで持ち、返すときに list にする
+CACHE_TTL = 3600
+_SEARCH_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=CACHE_TTL)
+_DRUGS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=CACHE_TTL)
+
+_SESSION = make_session()
+
+
+DETAIL_PARAMS = {
+    # Intervention モジュールだけ取り出せばレスポンスが軽い
+    "fields": "protocolSection.armsInterventionsModule.interventions",
+    "format": "json",
+}
+
+
+def _search_params(trial_name: str) -> dict:
+    return {
         "query.titles": trial_name,
-        "fields": "NCTId,BriefTitle,protocolSection.armsInterventionsModule.interventions",
-        "pageSize": 5,
+        # 使うのは先頭ヒットの NCT ID だけなので、それ以外は返させない
+        "fields": "protocolSection.identificationModule.nctId",
+        "pageSize": 1,
         "format": "json",
     }
 
-    resp = requests.get(f"{BASE}/studies", params=params, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
 
+def _extract_nct_id(data: dict) -> Optional[str]:
     studies = data.get("studies", [])
     if not studies:
         return None
@@ -27,24 +48,45 @@ def _search_nct_id(trial_name: str) -> Optional[str]:
     return studies[0]["protocolSection"]["identificationModule"]["nctId"]
 
 
-def _get_drugs_from_nct(nct_id: str) -> List[str]:
+def _extract_drugs(det_json: dict) -> List[str]:
+    interventions = det_json["protocolSection"]["armsInterventionsModule"]["interventions"]
+
+    # type が "Drug" のものだけ抜き出す
+    return [item["name"] for item in interventions if item.get("type") == "DRUG"]
+
+
+def _search_nct_id(trial_name: str) -> Optional[str]:
     """
-    NCT ID から介入薬の一般名を抽出してリストで返す
+    試験の略称・正式名称（例: "CheckMate 227"）を投げて
+    最も関連性が高い候補の NCT ID を返す
     """
-    detail_params = {
-        # Intervention モジュールだけ取り出せばレスポンスが軽い
-        "fields": "protocolSection.armsInterventionsModule.interventions",
-        "format": "json",
-    }
-    det_resp = requests.get(f"{BASE}/studies/{nct_id}", params=detail_params, timeout=30)
-    det_resp.raise_for_status()
-    det_json = det_resp.json()
+    key = hashkey(trial_name)
+    nct_id = _SEARCH_CACHE.get(key)
+    if nct_id is not None:
+        return nct_id
 
-    interventions = det_json["protocolSection"]["armsInterventionsModule"]["interventions"]
+    resp = _SESSION.get(f"{BASE}/studies", params=_search_params(trial_name), timeout=30)
+    resp.raise_for_status()
+    nct_id = _extract_nct_id(orjson.loads(resp.content))
+    if nct_id:
+        _SEARCH_CACHE[key] = nct_id
+    return nct_id
 
-    # type が "Drug" のものだけ抜き出す
-    drugs = [item["name"] for item in interventions if item.get("type") == "DRUG"]
 
+def _get_drugs_from_nct(nct_id: str) -> List[str]:
+    """
+    NCT ID から介入薬の一般名を抽出してリストで返す
+    """
+    key = hashkey(nct_id)
+    drugs = _DRUGS_CACHE.get(key)
+    if drugs is not None:
+        return list(drugs)
+
+    det_resp = _SESSION.get(f"{BASE}/studies/{nct_id}", params=DETAIL_PARAMS, timeout=30)
+    det_resp.raise_for_status()
+    drugs = _extract_drugs(orjson.loads(det_resp.content))
+    if drugs:
+        _DRUGS_CACHE[key] = tuple(drugs)
     return drugs
 
 
@@ -63,6 +105,94 @@ def get_trial_drugs(trial_name: str) -> Tuple[str, List[str]]:
     return nct_id, drugs
 
 
+# --------------------------------------------------------------------------- #
+# 非同期版（複数試験の一括取得用）                                            #
+# --------------------------------------------------------------------------- #
+async def _get_with_retry(client: httpx.AsyncClient, url: str, params: dict) -> httpx.Response:
+    """
+    同期版の Retry と同じく、429 / 5xx は指数バックオフで再試行する。
+    Retry-After（秒）が返ってきたときはそちらに従う。
+    """
+    for attempt in range(RETRY_TOTAL + 1):
+        resp = await client.get(url, params=params)
+        if resp.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+            break
+        retry_after = resp.headers.get("Retry-After", "")
+        await asyncio.sleep(int(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * 2**attempt)
+    resp.raise_for_status()
+    return resp
+
+
+async def _search_nct_id_async(client: httpx.AsyncClient, trial_name: str) -> Optional[str]:
+    """_search_nct_id の非同期版（キャッシュは同期版と共有）"""
+    key = hashkey(trial_name)
+    nct_id = _SEARCH_CACHE.get(key)
+    if nct_id is not None:
+        return nct_id
+
+    resp = await _get_with_retry(client, f"{BASE}/studies", _search_params(trial_name))
+    nct_id = _extract_nct_id(orjson.loads(resp.content))
+    if nct_id:
+        _SEARCH_CACHE[key] = nct_id
+    return nct_id
+
+
+async def _get_drugs_from_nct_async(client: httpx.AsyncClient, nct_id: str) -> List[str]:
+    """_get_drugs_from_nct の非同期版（キャッシュは同期版と共有）"""
+    key = hashkey(nct_id)
+    drugs = _DRUGS_CACHE.get(key)
+    if drugs is not None:
+        return list(drugs)
+
+    det_resp = await _get_with_retry(client, f"{BASE}/studies/{nct_id}", DETAIL_PARAMS)
+    drugs = _extract_drugs(orjson.loads(det_resp.content))
+    if drugs:
+        _DRUGS_CACHE[key] = tuple(drugs)
+    return drugs
+
+
+async def _get_trial_drugs_async(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, trial_name: str
+) -> Tuple[str, List[str]]:
+    """1 試験分の 検索 → 詳細取得。他の試験とは並行に進む"""
+    async with sem:
+        nct_id = await _search_nct_id_async(client, trial_name)
+        if not nct_id:
+            raise ValueError(f"試験名 '{trial_name}' で NCT ID が見つかりませんでした。")
+
+        drugs = await _get_drugs_from_nct_async(client, nct_id)
+        if not drugs:
+            raise RuntimeError(f"NCT {nct_id} で薬剤情報が取得できませんでした。")
+
+    return nct_id, drugs
+
+
+TrialResult = Union[Tuple[str, List[str]], Exception]
+
+
+async def get_trial_drugs_async(names: List[str]) -> List[TrialResult]:
+    """
+    複数の試験名をまとめて処理し、入力順に `(NCT ID, [drug, drug, ...])` のリストを返す。
+    取得に失敗した試験はその位置に例外（ValueError / RuntimeError / httpx.HTTPError など）が入り、
+    他の試験の結果は失われない。
+    HTTP/2 のコネクションを 1 本使い回し、試験ごとの 検索 → 詳細取得 を並行に実行する。
+    """
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    # 接続エラーはトランスポート側で再試行する（429 / 5xx は _get_with_retry）
+    transport = httpx.AsyncHTTPTransport(http2=True, retries=RETRY_TOTAL)
+    async with httpx.AsyncClient(transport=transport, timeout=30) as client:
+        return list(
+            await asyncio.gather(
+                *(_get_trial_drugs_async(client, sem, name) for name in names), return_exceptions=True
+            )
+        )
+
+
+def get_trial_drugs_batch(names: List[str]) -> List[TrialResult]:
+    """get_trial_drugs_async の同期ラッパー"""
+    return asyncio.run(get_trial_drugs_async(names))
+
+
 if __name__ == "__main__":
     trial = "CheckMate 227"
     nct, drug_list = get_trial_drugs(trial)
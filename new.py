@@ -18,14 +18,14 @@ and save as *output.pptx*.
 """
 
 import zipfile
-import shutil
-import os
-import tempfile
 import copy
 import re
+from io import BytesIO
 from pathlib import Path
 from lxml import etree as ET
 
+from pptx_zip import zip_compression
+
 INPUT_PPTX = "input_2.pptx"
 OUTPUT_PPTX = "output_2.pptx"
 
@@ -36,114 +36,203 @@ NS = {
     "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
     "p14": "http://schemas.microsoft.com/office/powerpoint/2010/main",
     "a14": "http://schemas.microsoft.com/office/drawing/2010/main",
+    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
 }
 
 
+# <p:set> ごとに評価する XPath は事前コンパイルしておく
+_XP_TIMING = ET.XPath("./p:timing | ./mc:AlternateContent/mc:Choice/p:timing", namespaces=NS)
+_XP_ATTR_NAMES = ET.XPath(".//p:attrNameLst/p:attrName/text()", namespaces=NS)
+_XP_SPID = ET.XPath(".//p:spTgt/@spid", namespaces=NS)
+_XP_TOVAL = ET.XPath("./p:to/p:strVal/@val", namespaces=NS)
+_XP_ANCESTOR_CTN = ET.XPath("ancestor::p:cTn[1]", namespaces=NS)
+
+# 図形として扱う要素のタグ（iter() にそのまま渡せる Clark 表記）
+SHAPE_TAGS = tuple(f"{{{NS['p']}}}{tag}" for tag in ("sp", "pic", "graphicFrame"))
+_P_CNVPR = f"{{{NS['p']}}}cNvPr"
+_P_SET = f"{{{NS['p']}}}set"
+_MC_FALLBACK = f"{{{NS['mc']}}}Fallback"
+# scan_slide で拾う要素
+SCAN_TAGS = SHAPE_TAGS + (_P_SET, _MC_FALLBACK)
+_NONDIGIT = re.compile(r"\D")
+
+# presentation.xml の編集で使う属性名・タグ名
+_R_ID = f"{{{NS['r']}}}id"
+_P_SLDID = f"{{{NS['p']}}}sldId"
+
+
 # --------------------------------------------------------------------------- #
 # Utility XML functions                                                       #
 # --------------------------------------------------------------------------- #
-def next_numeric_id(existing, prefix="rId"):
-    nums = [int(re.sub(r"\D", "", s)) for s in existing if re.sub(r"\D", "", s)]
-    return f"{prefix}{max(nums, default=0) + 1}"
+def max_numeric_id(existing):
+    """既存 ID（"rId3" など）の数値部分の最大値を返す。数字を含まない ID は無視する"""
+    digits = (_NONDIGIT.sub("", s) for s in existing)
+    return max((int(d) for d in digits if d), default=0)
 
 
-def collect_shapes(slide_tree):
-    shapes = {}
-    for el in slide_tree.xpath("//p:sp | //p:pic | //p:graphicFrame", namespaces=NS):
-        cNvPr = el.find(".//p:cNvPr", namespaces=NS)
-        if cNvPr is None:
-            continue
-        try:
-            spid = int(cNvPr.get("id"))
-            shapes[spid] = el
-        except (TypeError, ValueError):
-            continue
-    return shapes
+def find_timing(slide_tree):
+    """
+    スライドの <p:timing> を返す（無ければ None）。
+    <p:timing> は <p:sld> 直下、p14 拡張時は mc:AlternateContent/mc:Choice の中にしか置かれない。
+    """
+    timings = _XP_TIMING(slide_tree)
+    return timings[0] if timings else None
+
+
+def _shape_id(el):
+    cNvPr = next(el.iter(_P_CNVPR), None)
+    if cNvPr is None:
+        return None
+    try:
+        return int(cNvPr.get("id"))
+    except (TypeError, ValueError):
+        return None
 
 
-def collect_visibility_events(slide_tree):
+def _visibility_event(set_el):
     """
-    Return list of tuples: (step_serial, spid, visible)
-    同じ <p:cTn>（＝同時刻）の <p:set> は同じ step_serial を持つ。
+    <p:set> が style.visibility を変えるものなら (ctn_key, spid, visible) を、それ以外は None を返す。
     """
+    # 1) style.visibility を変える <p:set> だけ対象
+    attr_names = _XP_ATTR_NAMES(set_el)
+    if "style.visibility" not in attr_names:
+        return None
+
+    spid_attr = _XP_SPID(set_el)
+    to_val = _XP_TOVAL(set_el)
+    if not spid_attr or not to_val:
+        return None
+
+    try:
+        spid = int(spid_attr[0])
+    except ValueError:
+        return None
+    visible = to_val[0] != "hidden"
+
+    # 2) 最近傍 <p:cTn> をグループキーに
+    ctn = _XP_ANCESTOR_CTN(set_el)
+    ctn_key = ctn[0].get("id") if ctn and ctn[0].get("id") else id(ctn[0] if ctn else set_el)
+    return ctn_key, spid, visible
+
+
+def scan_slide(source):
+    """
+    スライド XML を 1 回のストリーミングパースで読み込み、(tree, shapes, events) を返す。
+
+    shapes: {spid: [図形要素, …]}  mc:AlternateContent の Choice / Fallback は同じ spid を持つ
+    events: [(step_serial, spid, visible), …]
+            同じ <p:cTn>（＝同時刻）の <p:set> は同じ step_serial を持つ。
+
+    スナップショット生成で元のツリーを丸ごと使うため、処理済みの要素も clear() はしない。
+    """
+    shapes = {}
     events = []
     ctn_to_serial = {}
-    step_serial = -1
+    in_fallback = False
 
-    for set_el in slide_tree.xpath("//p:set", namespaces=NS):
-        # 1) style.visibility を変える <p:set> だけ対象
-        attr_names = set_el.xpath(".//p:attrNameLst/p:attrName/text()", namespaces=NS)
-        if "style.visibility" not in attr_names:
+    context = ET.iterparse(source, events=("start", "end"), tag=SCAN_TAGS)
+    for event, el in context:
+        if el.tag == _MC_FALLBACK:
+            in_fallback = event == "start"
             continue
-
-        spid_attr = set_el.xpath(".//p:spTgt/@spid", namespaces=NS)
-        to_val = set_el.xpath("./p:to/p:strVal/@val", namespaces=NS)
-        if not spid_attr or not to_val:
+        if event == "start":
             continue
 
-        try:
-            spid = int(spid_attr[0])
-        except ValueError:
-            continue
-        visible = to_val[0] != "hidden"
-
-        # 2) 最近傍 <p:cTn> をグループキーに
-        ctn = set_el.xpath("ancestor::p:cTn[1]", namespaces=NS)
-        ctn_key = ctn[0].get("id") if ctn and ctn[0].get("id") else id(ctn[0] if ctn else set_el)
-
-        if ctn_key not in ctn_to_serial:
-            step_serial += 1
-            ctn_to_serial[ctn_key] = step_serial
-        events.append((ctn_to_serial[ctn_key], spid, visible))
+        if el.tag == _P_SET:
+            # Fallback 側の <p:timing> は Choice 側と重複するので読まない
+            if in_fallback:
+                continue
+            found = _visibility_event(el)
+            if found is None:
+                continue
+            ctn_key, spid, visible = found
+            if ctn_key not in ctn_to_serial:
+                ctn_to_serial[ctn_key] = len(ctn_to_serial)
+            events.append((ctn_to_serial[ctn_key], spid, visible))
+        else:
+            spid = _shape_id(el)
+            if spid is not None:
+                shapes.setdefault(spid, []).append(el)
 
-    return events
+    return ET.ElementTree(context.root), shapes, events
 
 
 def build_snapshots(shapes, events):
     """
     events: [(step_serial, spid, visible), …]  で昇順に並んでいる前提。
     """
-    state = {spid: True for spid in shapes}
-
-    # 出現アニメの初回は最初は非表示に
-    first_change = {}
-    for _, spid, vis in events:
-        if spid not in first_change:
-            first_change[spid] = vis
-            if vis:
-                state[spid] = False
+    initial = {spid: True for spid in shapes}
+    changed = {}  # イベントで状態が決まった図形だけを持つ
 
-    snapshots = [copy.deepcopy(state)]  # step0（初期）
+    snapshots = [changed.copy()]  # step0（初期）
 
     current_step = -1
     for step_serial, spid, visible in events:
         if step_serial != current_step:
             if current_step != -1:  # -1 は初期
-                snapshots.append(copy.deepcopy(state))
+                snapshots.append(changed.copy())
             current_step = step_serial
-        state[spid] = visible
+        # 出現アニメの初回は最初は非表示に
+        if visible and spid not in changed:
+            initial[spid] = False
+        changed[spid] = visible
+
+    snapshots.append(changed.copy())  # 最終状態
+
+    # 初期状態はイベントを最後まで見ないと確定しないので、最後に重ね合わせる
+    return [{**initial, **snap} for snap in snapshots]
+
+
+def shape_paths(shapes):
+    """
+    scan_slide の shapes を {spid: (ルートからの子インデックス列, …)} に変換する。
+    deepcopy したツリーでも同じインデックスをたどれば同じ図形に着くので、
+    スナップショットごとに図形ツリーを走査し直さずに済む。
+    """
+    paths = {}
+    for spid, els in shapes.items():
+        paths[spid] = tuple(_element_path(el) for el in els)
+    return paths
+
 
-    snapshots.append(copy.deepcopy(state))  # 最終状態
-    return snapshots
+def _element_path(el):
+    path = []
+    parent = el.getparent()
+    while parent is not None:
+        path.append(parent.index(el))
+        el, parent = parent, parent.getparent()
+    return tuple(reversed(path))
 
 
-def materialise_snapshot(orig_tree, visible_map):
+def _resolve_path(root, path):
+    el = root
+    for i in path:
+        el = el[i]
+    return el
+
+
+def _serialize(tree):
+    return ET.tostring(tree, encoding="UTF-8", xml_declaration=True)
+
+
+def materialise_snapshot(orig_tree, visible_map, spid_paths):
     tree = copy.deepcopy(orig_tree)
-    timing = tree.find(".//p:timing", namespaces=NS)
+    root = tree.getroot()
+
+    # インデックスはコピー元の構造が前提なので、要素を外す前にすべて解決しておく
+    hidden = [
+        _resolve_path(root, path)
+        for spid, visible in visible_map.items()
+        if not visible
+        for path in spid_paths.get(spid, ())
+    ]
+
+    timing = find_timing(root)
     if timing is not None:
         timing.getparent().remove(timing)
 
-    for el in tree.xpath("//p:sp | //p:pic | //p:graphicFrame", namespaces=NS):
-        cNvPr = el.find(".//p:cNvPr", namespaces=NS)
-        if cNvPr is None:
-            continue
-        try:
-            spid = int(cNvPr.get("id"))
-        except (TypeError, ValueError):
-            continue
-
-        if not visible_map.get(spid, True):
-            el.getparent().remove(el)
+    for el in hidden:
+        el.getparent().remove(el)
 
     return tree
 
@@ -155,21 +244,19 @@ def main():
     if not Path(INPUT_PPTX).is_file():
         raise FileNotFoundError(f'"{INPUT_PPTX}" not found')
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with zipfile.ZipFile(INPUT_PPTX, "r") as zin:
-            zin.extractall(tmpdir)
+    with zipfile.ZipFile(INPUT_PPTX, "r") as zin:
+        part_names = set(zin.namelist())
 
-        ppt_path = Path(tmpdir) / "ppt"
-        slides_dir = ppt_path / "slides"
-        rels_dir = slides_dir / "_rels"
+        # 書き換え・追加したパーツ {パーツ名: XML バイト列}。それ以外は入力 zip からそのままコピーする
+        changed = {}
 
-        pres_xml_path = ppt_path / "presentation.xml"
-        pres_tree = ET.parse(pres_xml_path)
+        pres_part = "ppt/presentation.xml"
+        pres_tree = ET.ElementTree(ET.fromstring(zin.read(pres_part)))
         pres_root = pres_tree.getroot()
         sldIdLst = pres_root.find("p:sldIdLst", namespaces=NS)
 
-        pres_rels_path = ppt_path / "_rels" / "presentation.xml.rels"
-        pres_rels_tree = ET.parse(pres_rels_path)
+        pres_rels_part = "ppt/_rels/presentation.xml.rels"
+        pres_rels_tree = ET.ElementTree(ET.fromstring(zin.read(pres_rels_part)))
         pres_rels_root = pres_rels_tree.getroot()
 
         relinfo = {rel.get("Id"): (rel.get("Target"), rel.get("Type")) for rel in pres_rels_root}
@@ -182,41 +269,46 @@ def main():
                     max_slide_num = max(max_slide_num, int(m.group(1)))
 
         max_sldId = max(int(el.get("id")) for el in sldIdLst)
+        # 新しい rId は既存の最大値から連番で振る
+        max_relId = max_numeric_id(relinfo)
 
         for sldId in list(sldIdLst):
-            relId = sldId.get(f'{{{NS["r"]}}}id')
+            relId = sldId.get(_R_ID)
             tgt, typ = relinfo[relId]
             if not typ.endswith("/slide"):
                 continue
 
-            slide_path = slides_dir / Path(tgt).name
-            slide_tree = ET.parse(slide_path)
-            shapes = collect_shapes(slide_tree)
-            events = collect_visibility_events(slide_tree)
+            slide_name = tgt.rsplit("/", 1)[-1]
+            slide_part = f"ppt/slides/{slide_name}"
+            slide_tree, shapes, events = scan_slide(BytesIO(zin.read(slide_part)))
+            spid_paths = shape_paths(shapes)
 
             if not events:
-                materialise_snapshot(slide_tree, {spid: True for spid in shapes}).write(
-                    slide_path, encoding="utf-8", xml_declaration=True
+                changed[slide_part] = _serialize(
+                    materialise_snapshot(slide_tree, {spid: True for spid in shapes}, spid_paths)
                 )
                 continue
 
             snapshots = build_snapshots(shapes, events)
 
             # step0 で差し替え
-            materialise_snapshot(slide_tree, snapshots[0]).write(slide_path, encoding="utf-8", xml_declaration=True)
+            changed[slide_part] = _serialize(materialise_snapshot(slide_tree, snapshots[0], spid_paths))
 
-            orig_rels_path = rels_dir / f"{slide_path.name}.rels"
+            orig_rels_part = f"ppt/slides/_rels/{slide_name}.rels"
+            orig_rels = zin.read(orig_rels_part) if orig_rels_part in part_names else None
             for visible in snapshots[1:]:
                 max_slide_num += 1
                 new_slide_name = f"slide{max_slide_num}.xml"
-                new_slide_path = slides_dir / new_slide_name
-                materialise_snapshot(slide_tree, visible).write(new_slide_path, encoding="utf-8", xml_declaration=True)
+                changed[f"ppt/slides/{new_slide_name}"] = _serialize(
+                    materialise_snapshot(slide_tree, visible, spid_paths)
+                )
 
-                if orig_rels_path.exists():
-                    shutil.copy(orig_rels_path, rels_dir / f"{new_slide_name}.rels")
+                if orig_rels is not None:
+                    changed[f"ppt/slides/_rels/{new_slide_name}.rels"] = orig_rels
 
                 # 関連付けと sldId を追加
-                new_relId = next_numeric_id(relinfo.keys(), "rId")
+                max_relId += 1
+                new_relId = f"rId{max_relId}"
                 rel_el = ET.Element(
                     "Relationship",
                     Id=new_relId,
@@ -227,20 +319,27 @@ def main():
                 relinfo[new_relId] = (rel_el.get("Target"), rel_el.get("Type"))
 
                 max_sldId += 1
-                new_sldId_el = ET.Element(ET.QName(NS["p"], "sldId"), id=str(max_sldId))
-                new_sldId_el.set(ET.QName(NS["r"], "id"), new_relId)
+                new_sldId_el = ET.Element(_P_SLDID, id=str(max_sldId))
+                new_sldId_el.set(_R_ID, new_relId)
                 sldId.addnext(new_sldId_el)
                 sldId = new_sldId_el  # ポインタ更新
 
-        pres_tree.write(pres_xml_path, encoding="utf-8", xml_declaration=True)
-        pres_rels_tree.write(pres_rels_path, encoding="utf-8", xml_declaration=True)
-
-        with zipfile.ZipFile(OUTPUT_PPTX, "w", zipfile.ZIP_DEFLATED) as zout:
-            for root, _, files in os.walk(tmpdir):
-                for filename in files:
-                    abs_path = Path(root) / filename
-                    rel_path = abs_path.relative_to(tmpdir)
-                    zout.write(abs_path, rel_path.as_posix())
+        changed[pres_part] = _serialize(pres_tree)
+        changed[pres_rels_part] = _serialize(pres_rels_tree)
+
+        with zipfile.ZipFile(OUTPUT_PPTX, "w") as zout:
+            # 手を入れていないパーツ（画像・動画など）はディスクに展開せず入力 zip から直接コピー
+            for info in zin.infolist():
+                compress_type, level = zip_compression(info.filename)
+                data = changed.pop(info.filename, None)
+                if data is None:
+                    data = zin.read(info)
+                zout.writestr(info, data, compress_type=compress_type, compresslevel=level)
+
+            # 新規に追加したスライドとその .rels
+            for name, data in changed.items():
+                compress_type, level = zip_compression(name)
+                zout.writestr(name, data, compress_type=compress_type, compresslevel=level)
 
     print(f'✅ Expanded presentation saved to "{OUTPUT_PPTX}"')
 
@@ -5,7 +5,7 @@ extract_comments.py ― PPTX コメント抽出スクリプト（PurePosixPath 
 依存: pip install lxml
 """
 
-from pathlib import Path, PurePosixPath
+from pathlib import Path
 from zipfile import ZipFile
 import posixpath
 from lxml import etree
@@ -16,29 +16,36 @@ NS = {
     "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
 }
 
+# パーサは全パートで使い回す。ID 属性の索引は使わないので作らせない
+_PARSER = etree.XMLParser(collect_ids=False)
+
 
 def _xml(zf: ZipFile, part: str) -> etree._Element:
-    return etree.fromstring(zf.read(part))
+    return etree.fromstring(zf.read(part), _PARSER)
 
 
 def extract_comments_per_slide(pptx: Path) -> dict[int, list[dict]]:
     results: dict[int, list[dict]] = {}
 
     with ZipFile(pptx) as zf:
+        # namelist() は呼ぶたびに新しいリストを作るので 1 度だけ取得し、存在確認は set で行う
+        part_names = zf.namelist()
+        names = set(part_names)
+
         # 1) コメント作者を取得
         author_map = {}
-        for part in zf.namelist():
+        for part in part_names:
             if part.startswith("ppt/commentAuthors/") and part.endswith(".xml"):
                 root = _xml(zf, part)
                 for n in root.xpath(".//p:cmAuthor", namespaces=NS):
                     author_map[n.get("id")] = n.get("name")
 
         # 2) スライドを走査
-        slide_parts = sorted(p for p in zf.namelist() if p.startswith("ppt/slides/slide") and p.endswith(".xml"))
+        slide_parts = sorted(p for p in part_names if p.startswith("ppt/slides/slide") and p.endswith(".xml"))
 
         for idx, slide_part in enumerate(slide_parts, start=1):
             rel_part = slide_part.replace("/slides/", "/slides/_rels/") + ".rels"
-            if rel_part not in zf.namelist():
+            if rel_part not in names:
                 continue
 
             rel_root = _xml(zf, rel_part)
@@ -50,12 +57,12 @@ def extract_comments_per_slide(pptx: Path) -> dict[int, list[dict]]:
                 continue
 
             # --- ここを修正 ---
-            base_dir = PurePosixPath(slide_part).parent  # ppt/slides
-            target = PurePosixPath(rel.get("Target"))  # ../comments/commentX.xml
-            cm_part = posixpath.normpath(str(base_dir.joinpath(target)))
+            base_dir = slide_part.rsplit("/", 1)[0]  # ppt/slides
+            target = rel.get("Target")  # ../comments/commentX.xml
+            cm_part = posixpath.normpath(posixpath.join(base_dir, target))
             # -----------------
 
-            if cm_part not in zf.namelist():
+            if cm_part not in names:
                 continue
 
             cm_root = _xml(zf, cm_part)
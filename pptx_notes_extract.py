@@ -20,9 +20,25 @@ import json
 from pathlib import Path
 from typing import Dict
 
+from lxml import etree
 from pptx import Presentation
 from pptx.oxml.ns import qn
 
+NS = {
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+}
+
+# 「名前空間付き show」属性のキー。スライドごとに qn() を呼ばないよう一度だけ作る
+_QN_SHOW = qn("p:show")
+
+# ノートの本文プレースホルダー（ph type="body"）の段落と、段落内のテキスト要素
+_XP_NOTES_PARAGRAPHS = etree.XPath(
+    "./p:cSld/p:spTree/p:sp[p:nvSpPr/p:nvPr/p:ph/@type='body'][1]/p:txBody/a:p", namespaces=NS
+)
+_XP_PARAGRAPH_TEXT = etree.XPath("./a:r/a:t | ./a:fld/a:t | ./a:br", namespaces=NS)
+_A_BR = "{%s}br" % NS["a"]
+
 
 def is_slide_hidden(slide) -> bool:
     """
@@ -31,10 +47,10 @@ def is_slide_hidden(slide) -> bool:
     - show 属性が存在しない or true  … Visible
     """
     # <p:sld> 要素は slide._element
-    # qn("p:show") は「名前空間付き show」用のキー
+    # _QN_SHOW は「名前空間付き show」用のキー
     # "show" は「名前空間なし show」用のキー
     # ファイル生成元による表記ゆれを吸収するため、両方をチェックする
-    val = slide._element.get(qn("p:show")) or slide._element.get("show")
+    val = slide._element.get(_QN_SHOW) or slide._element.get("show")
 
     # 非表示スライドのときに出力する
     if val in ("0", "false", "False"):
@@ -42,13 +58,24 @@ def is_slide_hidden(slide) -> bool:
     return val is not None and val in ("0", "false", "False")
 
 
+def notes_text(notes_el) -> str:
+    """
+    ノートスライドの XML (<p:notes>) から本文テキストを取り出す。
+    python-pptx の notes_text_frame.text と同じく段落は改行、<a:br> は垂直タブで連結する。
+    """
+    return "\n".join(
+        "".join("\v" if t.tag == _A_BR else (t.text or "") for t in _XP_PARAGRAPH_TEXT(para))
+        for para in _XP_NOTES_PARAGRAPHS(notes_el)
+    )
+
+
 def extract_visible_notes(pptx_path: Path) -> dict[int, str]:
     prs = Presentation(pptx_path)
     results = {}
     for idx, s in enumerate(prs.slides, start=1):
         if is_slide_hidden(s):
             continue  # 非表示スライドをスキップ
-        note = s.notes_slide.notes_text_frame.text.strip() if s.has_notes_slide else ""
+        note = notes_text(s.notes_slide._element).strip() if s.has_notes_slide else ""
         results[idx] = note
     return results
 
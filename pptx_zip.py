@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pptx_zip.py ― pptx を書き出すスクリプト（new.py / split_slide.py / split_anim.py / unhide_slides.py）で
+共有する zip 圧縮の設定
+"""
+
+from __future__ import annotations
+
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+from typing import Optional, Tuple
+
+# 形式そのものが圧縮済みのメディアは DEFLATE しても縮まず CPU を使うだけなので、無圧縮で格納する。
+# EMF / WMF（ベクタのメタファイル）、WAV（多くは生の PCM）、.bin（OLE 複合ファイル）は圧縮されていないので、ここには入れない
+STORED_EXTS = {
+    "png", "jpg", "jpeg", "gif",  # 画像
+    "mp4", "m4v", "mov", "mp3", "m4a", "wma",  # 動画・音声
+}
+
+
+def zip_compression(name: str) -> Tuple[int, Optional[int]]:
+    """
+    パーツ名の拡張子から (compress_type, compresslevel) を決める。
+    XML / .rels はレベル 1 でも十分縮むので、CPU を食う既定レベルは使わない。
+    """
+    if name.rsplit(".", 1)[-1].lower() in STORED_EXTS:
+        return ZIP_STORED, None
+    return ZIP_DEFLATED, 1
@@ -18,21 +18,21 @@ LLM 用に「テキストやグラフが隠れない」静的スライドを生
 
 依存
 ------
-    pip install python-pptx lxml
+    pip install lxml
 """
 
 from __future__ import annotations
 
+import codecs
+import re
 from copy import deepcopy
 from pathlib import Path
 from zipfile import ZipFile
-import posixpath
-from typing import Tuple, Set, Dict
+from typing import Tuple, Set, Dict, List
 
 from lxml import etree
-from pptx import Presentation
-from pptx.slide import Slide
-from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+from pptx_zip import zip_compression
 
 # ---------- 設定 ---------- #
 INPUT = Path(__file__).with_name("input.pptx")
@@ -44,11 +44,38 @@ OUTPUT = Path(__file__).with_name("out_split.pptx")
 NS: Dict[str, str] = {
     "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
     "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "ct": "http://schemas.openxmlformats.org/package/2006/content-types",
     "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
     "p14": "http://schemas.microsoft.com/office/powerpoint/2010/main",
     "a14": "http://schemas.microsoft.com/office/drawing/2010/main",
+    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
 }
 
+# スライド XML のパーサは全スライドで使い回す。ID 属性の索引は使わないので作らせない
+_PARSER = etree.XMLParser(collect_ids=False)
+
+# <p:timing> は <p:sld> 直下、p14 拡張時は mc:AlternateContent/mc:Choice の中にしか置かれない
+_XP_TIMING = etree.XPath("./p:timing | ./mc:AlternateContent/mc:Choice/p:timing", namespaces=NS)
+
+# extract_entr_exit_ids が判定対象にする要素のタグ（Clark 表記）
+_P_ANIM_EFFECT = "{%s}animEffect" % NS["p"]
+_P_CTN = "{%s}cTn" % NS["p"]
+_P_SET = "{%s}set" % NS["p"]
+_P_ANIM_MOTION = "{%s}animMotion" % NS["p"]
+_P14_ANIM_EFFECT = "{%s}animEffect" % NS["p14"]
+_ANIM_TAGS = (_P_ANIM_EFFECT, _P_CTN, _P_SET, _P_ANIM_MOTION, _P14_ANIM_EFFECT)
+
+# 単純な子孫走査は XPath を通さず iter() で拾う
+_P_SPTGT = "{%s}spTgt" % NS["p"]
+_P_ATTR_NAME = "{%s}attrName" % NS["p"]
+
+# 判定中に要素ごとに評価する相対 XPath（スライドごとの再コンパイルを避けるため事前にコンパイル）
+_XP_SET_VIS = etree.XPath(".//p:set[p:attrName='style.visibility']/p:to/p:strVal/@val", namespaces=NS)
+_XP_TO_STRVAL = etree.XPath("./p:to/p:strVal/@val", namespaces=NS)
+_XP_TO_VAL = etree.XPath("./p:to/@val", namespaces=NS)
+_XP_TO_VALLST = etree.XPath("./p:to/@valLst", namespaces=NS)
+
 
 # ---------------------------------------------------------------------
 # 2. アニメーション解析 ― Entrance / Exit 形状 id を検出
@@ -82,166 +109,273 @@ def extract_entr_exit_ids(slide_xml: etree._Element) -> Tuple[Set[str], Set[str]
     entrance: Set[str] = set()
     exit_: Set[str] = set()
 
-    # 2‑1) animEffect  (presetClass / filter)
-    for eff in slide_xml.xpath(".//p:animEffect", namespaces=NS):
-        cls = (eff.get("presetClass") or "").lower()
-        filt = (eff.get("filter") or "").lower()
-        ids = {t.get("spid") for t in eff.xpath(".//p:spTgt", namespaces=NS)}
-        if cls == "entr" or filt.startswith("in:"):
-            _add(entrance, ids)
-        elif cls == "exit" or filt.startswith("out:"):
-            _add(exit_, ids)
-
-    # 2‑2) clickEffect (nodeType) + visibility
-    for ctn in slide_xml.xpath(".//p:cTn[@nodeType='clickEffect']", namespaces=NS):
-        cls = (ctn.get("presetClass") or "").lower()
-        ids = {t.get("spid") for t in ctn.xpath(".//p:spTgt", namespaces=NS)}
-        if cls in ("entr", "exit"):
-            _add(entrance if cls == "entr" else exit_, ids)
-        else:
-            vis = ctn.xpath(
-                ".//p:set[p:attrName='style.visibility']/p:to/p:strVal/@val",
-                namespaces=NS,
-            )
-            if vis:
-                _add(exit_ if vis[0] == "hidden" else entrance, ids)
-
-    # 2‑3) set (visibility / opacity)
-    for s in slide_xml.xpath(".//p:set", namespaces=NS):
-        ids = {t.get("spid") for t in s.xpath(".//p:spTgt", namespaces=NS)}
-        attr = {n.text.lower() for n in s.xpath(".//p:attrName", namespaces=NS)}
-        to_val = (
-            s.xpath("./p:to/p:strVal/@val", namespaces=NS)
-            or s.xpath("./p:to/@val", namespaces=NS)
-            or s.xpath("./p:to/@valLst", namespaces=NS)
-        )
-        to_val = to_val[0] if to_val else ""
-        if "style.visibility" in attr:
-            _add(exit_ if to_val == "hidden" else entrance, ids)
-        elif {"opacity", "style.opacity"} & attr:
-            _add(exit_ if to_val in ("0", "0.0") else entrance, ids)
-
-    # 2‑4) motionPath → スライド外
-    for mot in slide_xml.xpath(".//p:animMotion", namespaces=NS):
-        to_xy = mot.find("./p:to", namespaces=NS)
-        if to_xy is not None:
-            x = int(to_xy.get("x", "0"))
-            y = int(to_xy.get("y", "0"))
-            # EMU 100 000 ≒ 100%
-            if x < 0 or y < 0 or x > 100000 or y > 100000:
-                ids = {t.get("spid") for t in mot.xpath(".//p:spTgt", namespaces=NS)}
+    # アニメーション要素は <p:timing> 配下にしか無いので、図形ツリーは走査しない
+    timings = _XP_TIMING(slide_xml)
+    if not timings:
+        return entrance, exit_
+    timing = timings[0]
+
+    # 2‑1〜2‑5 の対象要素を 1 回の走査で拾い、タグごとに判定する
+    for _, el in etree.iterwalk(timing, events=("end",), tag=_ANIM_TAGS):
+        tag = el.tag
+
+        # 2‑1) animEffect  (presetClass / filter)
+        if tag == _P_ANIM_EFFECT:
+            cls = (el.get("presetClass") or "").lower()
+            filt = (el.get("filter") or "").lower()
+            ids = {t.get("spid") for t in el.iter(_P_SPTGT)}
+            if cls == "entr" or filt.startswith("in:"):
+                _add(entrance, ids)
+            elif cls == "exit" or filt.startswith("out:"):
                 _add(exit_, ids)
 
-    # 2‑5) 3D Arrive / Leave (p14)
-    for node in slide_xml.xpath(".//p14:animEffect", namespaces=NS):
-        cls = (node.get("presetClass") or "").lower()
-        ids = {t.get("spid") for t in node.xpath(".//p:spTgt", namespaces=NS)}
-        if cls == "entr":
-            _add(entrance, ids)
-        elif cls == "exit":
-            _add(exit_, ids)
+        # 2‑2) clickEffect (nodeType) + visibility
+        elif tag == _P_CTN:
+            if el.get("nodeType") != "clickEffect":
+                continue
+            cls = (el.get("presetClass") or "").lower()
+            ids = {t.get("spid") for t in el.iter(_P_SPTGT)}
+            if cls in ("entr", "exit"):
+                _add(entrance if cls == "entr" else exit_, ids)
+            else:
+                vis = _XP_SET_VIS(el)
+                if vis:
+                    _add(exit_ if vis[0] == "hidden" else entrance, ids)
+
+        # 2‑3) set (visibility / opacity)
+        elif tag == _P_SET:
+            ids = {t.get("spid") for t in el.iter(_P_SPTGT)}
+            attr = {n.text.lower() for n in el.iter(_P_ATTR_NAME)}
+            to_val = (
+                _XP_TO_STRVAL(el)
+                or _XP_TO_VAL(el)
+                or _XP_TO_VALLST(el)
+            )
+            to_val = to_val[0] if to_val else ""
+            if "style.visibility" in attr:
+                _add(exit_ if to_val == "hidden" else entrance, ids)
+            elif {"opacity", "style.opacity"} & attr:
+                _add(exit_ if to_val in ("0", "0.0") else entrance, ids)
+
+        # 2‑4) motionPath → スライド外
+        elif tag == _P_ANIM_MOTION:
+            to_xy = el.find("./p:to", namespaces=NS)
+            if to_xy is not None:
+                x = int(to_xy.get("x", "0"))
+                y = int(to_xy.get("y", "0"))
+                # EMU 100 000 ≒ 100%
+                if x < 0 or y < 0 or x > 100000 or y > 100000:
+                    ids = {t.get("spid") for t in el.iter(_P_SPTGT)}
+                    _add(exit_, ids)
+
+        # 2‑5) 3D Arrive / Leave (p14)
+        else:
+            cls = (el.get("presetClass") or "").lower()
+            ids = {t.get("spid") for t in el.iter(_P_SPTGT)}
+            if cls == "entr":
+                _add(entrance, ids)
+            elif cls == "exit":
+                _add(exit_, ids)
 
     return entrance, exit_
 
 
 # ---------------------------------------------------------------------
-# 3. スライド複製 ― src の直後にクローンし rels を同期
+# 3. スライド複製 ― 元スライドの XML から図形を落とした静的スライドを作る
 # ---------------------------------------------------------------------
-_RELS_COPY_TYPES = {
-    RT.IMAGE,
-    RT.CHART,
-    RT.MEDIA,
-    RT.VIDEO,
-    RT.OLE_OBJECT,
+PRES_PART = "ppt/presentation.xml"
+PRES_RELS_PART = "ppt/_rels/presentation.xml.rels"
+CT_PART = "[Content_Types].xml"
+
+_RT_SLIDE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide"
+_CT_SLIDE = "application/vnd.openxmlformats-officedocument.presentationml.slide+xml"
+
+# ノート・コメントは 1 枚のスライドにしか紐付けられないので、クローンには引き継がない
+_RELS_SKIP_TYPES = {
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide",
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments",
 }
 
+# presentation.xml / .rels / [Content_Types].xml の編集で使うタグ名・属性名（Clark 表記）
+_R_ID = "{%s}id" % NS["r"]
+_P_SLDID = "{%s}sldId" % NS["p"]
+_REL = "{%s}Relationship" % NS["rel"]
+_CT_OVERRIDE = "{%s}Override" % NS["ct"]
+_MC_CHOICE = "{%s}Choice" % NS["mc"]
+
+_UTF16_BOMS = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+_SLIDE_PART = re.compile(r"ppt/slides/slide(\d+)\.xml")
+_NONDIGIT = re.compile(r"\D")
+
+
+def max_numeric_id(existing) -> int:
+    """既存の ID（"rId3" など）の数値部分の最大値を返す。無ければ 0"""
+    return max((int(_NONDIGIT.sub("", s) or 0) for s in existing), default=0)
+
 
-def clone_slide_after(prs: Presentation, src: Slide) -> Slide:
+def _serialize(root: etree._Element) -> bytes:
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def remove_timing(slide_xml: etree._Element) -> None:
     """
-    - 新しい空白スライドを末尾へ add し
-    - sldId を src の直後に移動
-    - shapes を deepcopy
-    - 画像/チャート等の rels を複製
-    Returns 追加した Slide オブジェクト
+    静的スライドにするため <p:timing> を外す。
+    mc:AlternateContent に包まれている場合は Fallback 側の timing ごと外す。
     """
-    blank = prs.slide_layouts[6]
-    new_slide = prs.slides.add_slide(blank)
+    for timing in _XP_TIMING(slide_xml):
+        parent = timing.getparent()
+        if parent.tag == _MC_CHOICE:
+            alt = parent.getparent()
+            alt.getparent().remove(alt)
+        else:
+            parent.remove(timing)
 
-    # sldId を順序どおり挿入
-    sldIdLst = prs.slides._sldIdLst
-    src_idx = list(prs.slides).index(src)
-    new_id = sldIdLst[-1]
-    sldIdLst.remove(new_id)
-    sldIdLst.insert(src_idx + 1, new_id)
 
-    # shapes deep copy
-    for shp in src.shapes:
-        new_slide.shapes._spTree.insert_element_before(deepcopy(shp.element), "p:extLst")
+def make_clones(slide_xml: etree._Element, ids_in: Set[str], ids_out: Set[str]) -> Tuple[bytes, bytes]:
+    """
+    元スライドの XML からアニメーションを落とし、
+    Before（入口を消す）/ After（出口を消す）の静的スライドを返す。
+    消す図形は 1 回の走査で両方ぶん拾い、After は slide_xml をそのまま書き換えて作る。
+    """
+    remove_timing(slide_xml)
+    sp_tree = slide_xml.find("p:cSld/p:spTree", namespaces=NS)
+    before = deepcopy(slide_xml)
+    if sp_tree is not None:
+        drop_in, drop_out = shape_positions(sp_tree, ids_in, ids_out)
+        drop_children(before.find("p:cSld/p:spTree", namespaces=NS), drop_in)
+        drop_children(sp_tree, drop_out)
+    return _serialize(before), _serialize(slide_xml)
 
-    # rels copy
-    for rel in src.part.rels.values():
-        if rel.reltype in _RELS_COPY_TYPES and rel.rId not in new_slide.part.rels:
-            new_slide.part.relate_to(rel._target, rel.reltype, rel.rId)
 
-    return new_slide
+def clone_rels(rels_blob: bytes) -> bytes:
+    """元スライドの .rels からクローンに引き継がない関連付けを除いたものを返す"""
+    rels = etree.fromstring(rels_blob, _PARSER)
+    for rel in list(rels):
+        if rel.get("Type") in _RELS_SKIP_TYPES:
+            rels.remove(rel)
+    return _serialize(rels)
 
 
 # ---------------------------------------------------------------------
-# 4. 図形削除 ― 再帰で親グループごと drop
+# 4. 図形削除 ― 図形を含む spTree 直下の要素（grpSp ならグループごと）を drop
 # ---------------------------------------------------------------------
-def drop_shapes(slide: Slide, target_ids: Set[str]) -> None:
+_P_CNVPR = "{%s}cNvPr" % NS["p"]
+
+# spTree 直下にあっても図形ではない要素
+_NON_SHAPE_TAGS = {"{%s}%s" % (NS["p"], tag) for tag in ("nvGrpSpPr", "grpSpPr", "extLst")}
+
+
+def shape_positions(sp_tree: etree._Element, ids_in: Set[str], ids_out: Set[str]) -> Tuple[List[int], List[int]]:
     """
-    target_ids に含まれる spid を持つ図形
-    （およびそれを子に含む grpSp）を削除
+    ids_in / ids_out に含まれる spid を持つ図形（およびそれを子に含む grpSp）の
+    spTree 直下での位置を、cNvPr の 1 回の走査でそれぞれ返す
     """
+    drop_in: List[int] = []
+    drop_out: List[int] = []
+    for pos, child in enumerate(sp_tree):
+        if child.tag in _NON_SHAPE_TAGS:
+            continue
+        ids = {el.get("id") for el in child.iter(_P_CNVPR)}
+        if not ids.isdisjoint(ids_in):
+            drop_in.append(pos)
+        if not ids.isdisjoint(ids_out):
+            drop_out.append(pos)
+    return drop_in, drop_out
 
-    def collect(el: etree._Element, trash: Set[etree._Element]) -> bool:
-        """True を返すと親 grpSp も削除対象"""
-        hit = el.get("id") in target_ids
-        for child in el:
-            hit = collect(child, trash) or hit
-        if hit:
-            trash.add(el)
-        return hit
 
-    candidates: Set[etree._Element] = set()
-    collect(slide.shapes._spTree, candidates)
-    for el in candidates:
-        parent = el.getparent()
-        if parent is not None:
-            parent.remove(el)
+def drop_children(sp_tree: etree._Element, positions: List[int]) -> None:
+    """spTree 直下の positions 番目の要素を削除"""
+    children = list(sp_tree)
+    for pos in positions:
+        sp_tree.remove(children[pos])
 
 
 # ---------------------------------------------------------------------
 # 5. メイン処理
 # ---------------------------------------------------------------------
 def split_pptx(in_path: Path, out_path: Path) -> bool:
-    prs = Presentation(in_path)
+    """
+    アニメーションのあるスライドごとに、直後へ Before / After の静的スライドを追加した pptx を書き出す。
+    python-pptx は使わず、zip 内の XML を直接書き換える。
+    Returns 1 枚でも分割したら True
+    """
     any_split = False
 
-    # スライド XML パス一覧
-    with ZipFile(in_path) as zf:
-        slide_parts = sorted(p for p in zf.namelist() if p.startswith("ppt/slides/slide") and p.endswith(".xml"))
-
-    for idx, part in enumerate(slide_parts, start=1):
-        with ZipFile(in_path) as zf:
-            slide_xml = etree.fromstring(zf.read(part))
-        ids_in, ids_out = extract_entr_exit_ids(slide_xml)
-        if not ids_in and not ids_out:
-            continue
-
-        src_slide = prs.slides[idx - 1]
-        # --- Before スライド ---
-        before = clone_slide_after(prs, src_slide)
-        drop_shapes(before, ids_in)  # 入口だけ消す
-
-        # --- After スライド ---
-        after = clone_slide_after(prs, src_slide)
-        drop_shapes(after, ids_out)  # 出口を消す
-
-        any_split = True
+    with ZipFile(in_path) as zin:
+        part_names = set(zin.namelist())
+
+        # 書き換え・追加したパーツ {パーツ名: XML バイト列}。それ以外は入力 zip からそのままコピーする
+        changed: Dict[str, bytes] = {}
+
+        pres = etree.fromstring(zin.read(PRES_PART), _PARSER)
+        # スライドが 1 枚も無いデッキでは sldIdLst 自体が無いこともある
+        sld_id_lst = pres.find("p:sldIdLst", namespaces=NS)
+        sld_ids = list(sld_id_lst) if sld_id_lst is not None else []
+        pres_rels = etree.fromstring(zin.read(PRES_RELS_PART), _PARSER)
+        targets = {rel.get("Id"): rel.get("Target") for rel in pres_rels}
+        content_types = etree.fromstring(zin.read(CT_PART), _PARSER)
+
+        # 新しいスライド番号・rId・sldId は既存の最大値から連番で振る
+        slide_nums = [int(m.group(1)) for m in map(_SLIDE_PART.fullmatch, part_names) if m]
+        max_slide_num = max(slide_nums, default=0)
+        max_rel_id = max_numeric_id(targets)
+        # sldId は 256 以上（仕様上の下限）
+        max_sld_id = max((int(el.get("id")) for el in sld_ids), default=255)
+
+        # sldIdLst は表示順。クローンを挿入していくので先に確定させた一覧を回す
+        for sld_id in sld_ids:
+            slide_name = targets[sld_id.get(_R_ID)].rsplit("/", 1)[-1]
+            raw = zin.read(f"ppt/slides/{slide_name}")
+            # アニメーションは <p:timing> 配下にしか無い。タグ名すら含まないスライドはパースせずに飛ばす。
+            # バイト列での判定は UTF-8 前提なので、UTF-16（BOM 付き）のパーツは判定せずにパースする
+            if not raw.startswith(_UTF16_BOMS) and b"timing" not in raw:
+                continue
+            slide_xml = etree.fromstring(raw, _PARSER)
+            ids_in, ids_out = extract_entr_exit_ids(slide_xml)
+            if not ids_in and not ids_out:
+                continue
+
+            rels_part = f"ppt/slides/_rels/{slide_name}.rels"
+            rels_blob = clone_rels(zin.read(rels_part)) if rels_part in part_names else None
+
+            # Before（入口だけ消す）→ After（出口を消す）の順に元スライドの直後へ並べる
+            for clone in make_clones(slide_xml, ids_in, ids_out):
+                max_slide_num += 1
+                new_name = f"slide{max_slide_num}.xml"
+                changed[f"ppt/slides/{new_name}"] = clone
+                if rels_blob is not None:
+                    changed[f"ppt/slides/_rels/{new_name}.rels"] = rels_blob
+                etree.SubElement(content_types, _CT_OVERRIDE, PartName=f"/ppt/slides/{new_name}", ContentType=_CT_SLIDE)
+
+                max_rel_id += 1
+                new_rel_id = f"rId{max_rel_id}"
+                etree.SubElement(pres_rels, _REL, Id=new_rel_id, Type=_RT_SLIDE, Target=f"slides/{new_name}")
+
+                max_sld_id += 1
+                new_sld_id = etree.Element(_P_SLDID, id=str(max_sld_id))
+                new_sld_id.set(_R_ID, new_rel_id)
+                sld_id.addnext(new_sld_id)
+                sld_id = new_sld_id  # 次のクローンはこの後ろへ
+
+            any_split = True
+
+        changed[PRES_PART] = _serialize(pres)
+        changed[PRES_RELS_PART] = _serialize(pres_rels)
+        changed[CT_PART] = _serialize(content_types)
+
+        with ZipFile(out_path, "w") as zout:
+            for info in zin.infolist():
+                compress_type, level = zip_compression(info.filename)
+                data = changed.pop(info.filename, None)
+                if data is None:
+                    data = zin.read(info)
+                zout.writestr(info, data, compress_type=compress_type, compresslevel=level)
+
+            # 新規に追加したスライドとその .rels
+            for name, data in changed.items():
+                compress_type, level = zip_compression(name)
+                zout.writestr(name, data, compress_type=compress_type, compresslevel=level)
 
-    prs.save(out_path)
     return any_split
 
 
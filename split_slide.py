@@ -45,6 +45,8 @@ import re
 from pathlib import Path
 from lxml import etree as ET
 
+from pptx_zip import zip_compression
+
 INPUT_PPTX = "input.pptx"
 OUTPUT_PPTX = "output.pptx"
 
@@ -55,19 +57,40 @@ NS = {
     "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
     "p14": "http://schemas.microsoft.com/office/powerpoint/2010/main",
     "a14": "http://schemas.microsoft.com/office/drawing/2010/main",
+    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
 }
 
 
+# collect_visibility_events で <p:set> ごとに評価する XPath は事前コンパイルしておく
+_XP_TIMING = ET.XPath("./p:timing | ./mc:AlternateContent/mc:Choice/p:timing", namespaces=NS)
+_XP_ATTR_NAMES = ET.XPath(".//p:attrNameLst/p:attrName/text()", namespaces=NS)
+_XP_SPID = ET.XPath(".//p:spTgt/@spid", namespaces=NS)
+_XP_TOVAL = ET.XPath("./p:to/p:strVal/@val", namespaces=NS)
+
+# presentation.xml の編集で使う属性名・タグ名（Clark 表記）
+_R_ID = f"{{{NS['r']}}}id"
+_P_SLDID = f"{{{NS['p']}}}sldId"
+
+_NONDIGIT = re.compile(r"\D")
+_SLIDE_NUM = re.compile(r"/slide(\d+)\.xml$")
+
+# 子孫走査は XPath を通さず iter() で済ませる
+_P_SET = f"{{{NS['p']}}}set"
+_P_CNVPR = f"{{{NS['p']}}}cNvPr"
+# 図形として扱う要素のタグ（iter() にそのまま渡す）
+SHAPE_TAGS = tuple(f"{{{NS['p']}}}{tag}" for tag in ("sp", "pic", "graphicFrame", "grpSp"))
+
+
 # --------------------------------------------------------------------------- #
 # Utility XML functions                                                       #
 # --------------------------------------------------------------------------- #
-def next_numeric_id(existing, prefix="rId"):
+def max_numeric_id(existing):
     """
-    既存のIDリストから最大の数値部分を探し、1増やした新しいID文字列を返す。
-    例: ["rId1", "rId2"] → "rId3"
+    既存のIDリストから最大の数値部分を返す。数字を含まない ID は無視する。
+    例: ["rId1", "rId2"] → 2
     """
-    nums = [int(re.sub(r"\D", "", s)) for s in existing if re.sub(r"\D", "", s)]
-    return f"{prefix}{max(nums, default=0) + 1}"
+    digits = (_NONDIGIT.sub("", s) for s in existing)
+    return max((int(d) for d in digits if d), default=0)
 
 
 def collect_shapes(slide_tree):
@@ -81,8 +104,8 @@ def collect_shapes(slide_tree):
     例: {1: <p:sp>...</p:sp>, 2: <p:pic>...</p:pic>, ...}
     """
     shapes = {}
-    for el in slide_tree.xpath("//p:sp | //p:pic | //p:graphicFrame | //p:grpSp", namespaces=NS):
-        cNvPr = el.find(".//p:cNvPr", namespaces=NS)
+    for el in slide_tree.iter(*SHAPE_TAGS):
+        cNvPr = next(el.iter(_P_CNVPR), None)
         if cNvPr is None:
             continue
         try:
@@ -93,6 +116,15 @@ def collect_shapes(slide_tree):
     return shapes
 
 
+def find_timing(slide_tree):
+    """
+    スライドの <p:timing> を返す（無ければ None）。
+    <p:timing> は <p:sld> 直下、p14 拡張時は mc:AlternateContent/mc:Choice の中にしか置かれない。
+    """
+    timings = _XP_TIMING(slide_tree)
+    return timings[0] if timings else None
+
+
 def collect_visibility_events(slide_tree):
     """
     スライドXMLから「表示/非表示」アニメーションイベント(spid, visible)のリストを抽出する。
@@ -105,17 +137,21 @@ def collect_visibility_events(slide_tree):
     例: [(1, True), (2, False), (3, True), ...]
     """
     events = []
-    for set_el in slide_tree.xpath("//p:set", namespaces=NS):
-        attr_names = set_el.xpath(".//p:attrNameLst/p:attrName/text()", namespaces=NS)
+
+    # <p:set> は <p:timing> 配下にしか無いので、図形ツリーは走査しない
+    timing = find_timing(slide_tree)
+    if timing is None:
+        return events
+
+    for set_el in timing.iter(_P_SET):
+        attr_names = _XP_ATTR_NAMES(set_el)
 
         # style.visibility を変える <p:set> が対象
         if "style.visibility" not in attr_names:
             continue
 
-        spid_attr = set_el.xpath(".//p:spTgt/@spid", namespaces=NS)  # 図形を識別するID
-        to_val = set_el.xpath(
-            "./p:to/p:strVal/@val", namespaces=NS
-        )  # アニメーション後の状態。表示:visible、非表示:hidden。
+        spid_attr = _XP_SPID(set_el)  # 図形を識別するID
+        to_val = _XP_TOVAL(set_el)  # アニメーション後の状態。表示:visible、非表示:hidden。
         if not spid_attr or not to_val:
             continue
 
@@ -154,13 +190,14 @@ def build_snapshots(shapes, events):
                 state[spid] = False
             else:
                 state[spid] = True
-    snaps = [copy.deepcopy(state)]
+    # 値は bool だけなので、スナップショットは浅いコピーで足りる
+    snaps = [dict(state)]
 
     # イベントに基づいて各shapeの状態を更新
     for spid, visible in events:
         if spid in state:
             state[spid] = visible
-        snaps.append(copy.deepcopy(state))
+        snaps.append(dict(state))
     return snaps
 
 
@@ -175,16 +212,15 @@ def materialise_snapshot(orig_tree, visible_map):
     if timing is not None:
         timing.getparent().remove(timing)
 
-    for el in tree.xpath("//p:sp | //p:pic | //p:graphicFrame | //p:grpSp", namespaces=NS):
-        cNvPr = el.find(".//p:cNvPr", namespaces=NS)
-        if cNvPr is None:
-            continue
-        try:
-            spid = int(cNvPr.get("id"))
-        except (TypeError, ValueError):
-            continue
+    # 消す spid は cNvPr@id と同じ文字列の set にしておき、図形ごとの int 変換を省く
+    hidden = {str(spid) for spid, visible in visible_map.items() if not visible}
+    if not hidden:
+        return tree
 
-        if not visible_map.get(spid, True):
+    # 走査中に要素を外すので、先に一覧を確定させておく
+    for el in list(tree.iter(*SHAPE_TAGS)):
+        cNvPr = next(el.iter(_P_CNVPR), None)
+        if cNvPr is not None and cNvPr.get("id") in hidden:
             el.getparent().remove(el)
 
     return tree
@@ -221,24 +257,22 @@ def main():
         relinfo = {rel.get("Id"): (rel.get("Target"), rel.get("Type")) for rel in pres_rels_root}
 
         # リレーションに新しいスライドを追加する用の最大スライド番号を取得(連番)
-        max_slide_num = 0
-        for tgt, typ in relinfo.values():
-            if typ.endswith("/slide"):
-                m = re.search(r"/slide(\d+)\.xml$", tgt)
-                if m:
-                    num = int(m.group(1))
-                    max_slide_num = max(max_slide_num, num)
+        slide_nums = (_SLIDE_NUM.search(tgt) for tgt, typ in relinfo.values() if typ.endswith("/slide"))
+        max_slide_num = max((int(m.group(1)) for m in slide_nums if m), default=0)
 
         # スライドに関連付けられたIDの最大値を取得(連番)
         max_sldId = max(int(el.get("id")) for el in sldIdLst)
 
+        # 新しい rId は既存の最大値から連番で振る（スライドを足すたびに全キーを走査し直さない）
+        max_relId = max_numeric_id(relinfo)
+
         for sldId in list(sldIdLst):
-            relId = sldId.get(f'{{{NS["r"]}}}id')
+            relId = sldId.get(_R_ID)
             tgt, typ = relinfo[relId]
             if not typ.endswith("/slide"):
                 continue  # スライドのみを処理対象とする
 
-            slide_path = slides_dir / Path(tgt).name
+            slide_path = slides_dir / tgt.rsplit("/", 1)[-1]
             slide_tree = ET.parse(slide_path)
             shapes = collect_shapes(slide_tree)
             events = collect_visibility_events(slide_tree)
@@ -267,7 +301,8 @@ def main():
                     shutil.copy(orig_rels_path, rels_dir / f"{new_slide_name}.rels")
 
                 # add new relationship
-                new_relId = next_numeric_id(relinfo.keys(), "rId")
+                max_relId += 1
+                new_relId = f"rId{max_relId}"
                 rel_el = ET.Element(
                     "Relationship",
                     Id=new_relId,
@@ -279,20 +314,21 @@ def main():
 
                 # add new sldId after current position
                 max_sldId += 1
-                new_sldId_el = ET.Element(ET.QName(NS["p"], "sldId"), id=str(max_sldId))
-                new_sldId_el.set(ET.QName(NS["r"], "id"), new_relId)
+                new_sldId_el = ET.Element(_P_SLDID, id=str(max_sldId))
+                new_sldId_el.set(_R_ID, new_relId)
                 sldId.addnext(new_sldId_el)
                 sldId = new_sldId_el  # advance reference
 
         pres_tree.write(pres_xml_path, encoding="utf-8", xml_declaration=True)
         pres_rels_tree.write(pres_rels_path, encoding="utf-8", xml_declaration=True)
 
-        with zipfile.ZipFile(OUTPUT_PPTX, "w", zipfile.ZIP_DEFLATED) as zout:
+        with zipfile.ZipFile(OUTPUT_PPTX, "w") as zout:
             for root, _, files in os.walk(tmpdir):
                 for filename in files:
                     abs_path = Path(root) / filename
                     rel_path = abs_path.relative_to(tmpdir)
-                    zout.write(abs_path, rel_path.as_posix())
+                    compress_type, level = zip_compression(filename)
+                    zout.write(abs_path, rel_path.as_posix(), compress_type=compress_type, compresslevel=level)
 
     print(f'✅ Expanded presentation saved to "{OUTPUT_PPTX}"')
 
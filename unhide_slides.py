@@ -3,10 +3,12 @@
 
 from __future__ import annotations
 from pathlib import Path
-from zipfile import ZipFile, ZIP_DEFLATED
+from zipfile import ZipFile
 from io import BytesIO
 from lxml import etree
 
+from pptx_zip import zip_compression
+
 INPUT_PPTX = "hide_input.pptx"
 OUTPUT_PPTX = "hide_output.pptx"
 
@@ -15,14 +17,17 @@ NS = {
     "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
 }
 
+# p:show と無名属性 show の両方を見る（生成ツールによって揺れるため）
+SHOW_ATTRS = ("show", "{%s}show" % NS["p"])
+
+
 
 def _unhide_slide_xml(xml_bytes: bytes) -> tuple[bytes, bool]:
     """ppt/slides/slideX.xml を受け取り、show 属性を外す/true にして返す"""
     root = etree.fromstring(xml_bytes)
     changed = False
 
-    # p:show と無名属性 show の両方を見る（生成ツールによって揺れるため）
-    for attr_name in ("show", "{%s}show" % NS["p"]):
+    for attr_name in SHOW_ATTRS:
         val = root.get(attr_name)
         if val is not None and val.lower() in ("0", "false"):
             root.set(attr_name, "1")  # もしくは root.attrib.pop(attr_name)
@@ -55,9 +60,11 @@ def unhide_all(input_pptx: Path, output_pptx: Path) -> tuple[int, int]:
     slides_fixed = 0
     ids_fixed = 0
 
-    with ZipFile(input_pptx, "r") as zin, ZipFile(output_pptx, "w", ZIP_DEFLATED) as zout:
-        for name in zin.namelist():
-            data = zin.read(name)
+    with ZipFile(input_pptx, "r") as zin, ZipFile(output_pptx, "w") as zout:
+        for info in zin.infolist():
+            name = info.filename
+            data = zin.read(info)
+            changed = False
 
             if name.startswith("ppt/slides/slide") and name.endswith(".xml"):
                 data, changed = _unhide_slide_xml(data)
@@ -67,9 +74,16 @@ def unhide_all(input_pptx: Path, output_pptx: Path) -> tuple[int, int]:
             elif name == "ppt/presentation.xml":
                 data, fixed = _unhide_presentation_xml(data)
                 ids_fixed += fixed
-
-            # そのまま/書き換えた data を書き出す
-            zout.writestr(name, data)
+                changed = bool(fixed)
+
+            # 元の ZipInfo を渡して日時などは引き継ぐ
+            if changed:
+                # 書き換えたパーツだけ圧縮方式を選び直す
+                compress_type, level = zip_compression(name)
+                zout.writestr(info, data, compress_type=compress_type, compresslevel=level)
+            else:
+                # 手を入れていないパーツは元のバイト列を、入力と同じ圧縮方式のまま書き出す
+                zout.writestr(info, data)
 
     return slides_fixed, ids_fixed
 